@@ -1,147 +1,154 @@
-# OIS_Fetcher.py - Adapted for Yahoo Finance using yfinance
+# OIS_Fetcher.py - Adapted for Yahoo Finance using the v8 chart API directly
 
-import yfinance as yf # Import yfinance
-import boto3
+import numpy as np
+import httpx
+import orjson
 import os
 import time
 from datetime import datetime, timezone, date, timedelta
-# import requests # No longer needed directly if yfinance handles requests
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from ois_core import store_rates
 
 # Configuration
 # --- IMPORTANT: Verify this is the correct Yahoo Finance ticker ---
 FED_FUNDS_FUTURES_TICKER = os.environ.get('FED_FUNDS_FUTURES_TICKER', 'ZQ=F')
-
-DYNAMODB_TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME', 'OISRATES')
-AWS_REGION = os.environ.get('AWS_REGION', 'eu-north-1')
-
-# Metric IDs
-METRIC_ID_OIS = os.environ.get('METRIC_ID_OIS', 'CALCULATED_OIS_1M_RATE')
-METRIC_ID_IMPLIED_FF = os.environ.get('METRIC_ID_IMPLIED_FF', 'IMPLIED_FF_RATE')
-
-dynamodb_client = boto3.client('dynamodb', region_name=AWS_REGION)
+YAHOO_CHART_URL = 'https://query1.finance.yahoo.com/v8/finance/chart/{ticker}'
+# Yahoo rejects requests without a browser-like User-Agent
+YAHOO_REQUEST_HEADERS = {'User-Agent': 'Mozilla/5.0'}
+YAHOO_REQUEST_TIMEOUT_SECONDS = 10
+# Transient failures (connection errors, timeouts, 429/5xx) are retried with exponential backoff
+YAHOO_MAX_RETRIES = 3
+YAHOO_RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Reused across calls so repeated fetches keep the TLS connection alive; HTTP/2 (negotiated
+# via ALPN) compresses headers and multiplexes requests over that one connection
+_http_client = None
+
+def _get_http_client():
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(http2=True, headers=YAHOO_REQUEST_HEADERS,
+                                    timeout=YAHOO_REQUEST_TIMEOUT_SECONDS)
+    return _http_client
+
+def _get_with_retries(url, params):
+    """
+    GETs url through the shared client, retrying transient failures with exponential backoff.
+    Raises httpx.HTTPError once retries are exhausted or for non-retryable HTTP errors.
+    """
+    for attempt in range(YAHOO_MAX_RETRIES + 1):
+        is_last_attempt = attempt == YAHOO_MAX_RETRIES
+        try:
+            response = _get_http_client().get(url, params=params)
+        except httpx.TransportError as e:
+            if is_last_attempt:
+                raise
+            print(f"Transient error fetching from Yahoo Finance ({e}), retrying...")
+        else:
+            if response.status_code not in YAHOO_RETRY_STATUS_CODES or is_last_attempt:
+                response.raise_for_status()
+                return response
+            print(f"Yahoo Finance returned HTTP {response.status_code}, retrying...")
+        time.sleep(2 ** attempt * 0.5)
+
+def _utc_midnight_epoch_seconds(day):
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+
+def _trading_date_midnights(timestamps, meta):
+    """
+    Maps bar timestamps (epoch seconds) to midnight of each bar's trading date in the exchange
+    timezone, as epoch seconds, matching the daily index yfinance produced. Each bar is
+    localized with the named timezone so DST changes inside the window are handled; the
+    request-time gmtoffset is only a fallback when the zone is missing or unknown.
+
+    The 2024-10-31 bar (05:00 UTC, midnight CDT) keeps its date across the November change:
+
+    >>> meta = {'exchangeTimezoneName': 'America/Chicago', 'gmtoffset': -21600}
+    >>> _trading_date_midnights(np.array([1730350800, 1730700000]), meta).tolist()
+    [1730350800, 1730700000]
+    >>> _trading_date_midnights(np.array([1730350800]), {'gmtoffset': -21600}).tolist()
+    [1730268000]
+    """
+    try:
+        exchange_tz = ZoneInfo(meta['exchangeTimezoneName'])
+    except (KeyError, TypeError, ValueError, ZoneInfoNotFoundError):
+        exchange_tz = None
+    if exchange_tz is None:
+        gmtoffset = int(meta.get('gmtoffset', 0))
+        return (timestamps + gmtoffset) // 86400 * 86400 - gmtoffset
+    midnights = []
+    for timestamp in timestamps.tolist():
+        trading_date = datetime.fromtimestamp(timestamp, tz=exchange_tz).date()
+        midnights.append(int(datetime(trading_date.year, trading_date.month, trading_date.day,
+                                      tzinfo=exchange_tz).timestamp()))
+    return np.array(midnights, dtype=np.int64)
 
 def fetch_fed_funds_futures_data():
     """
-    Fetches historical Fed Funds futures data from Yahoo Finance using yfinance.
+    Fetches historical Fed Funds futures data from the Yahoo Finance chart endpoint.
     We need the last few days of data.
+    Returns a (timestamps_ms, closes) pair of numpy arrays in chronological order, or None.
     """
     print(f"Fetching Fed Funds futures data for ticker: {FED_FUNDS_FUTURES_TICKER} from Yahoo Finance")
+    # Let's try to get data for the last ~10 days to ensure we have the last 3 trading days.
+    # For futures, 'range' might be tricky. Using explicit period1/period2 is more reliable.
+    end_date = date.today()
+    start_date = end_date - timedelta(days=10) # Get a small window
+    end_epoch_seconds = _utc_midnight_epoch_seconds(end_date)
+    params = {
+        'period1': _utc_midnight_epoch_seconds(start_date),
+        'period2': end_epoch_seconds,
+        'interval': '1d',
+        'includePrePost': 'false',
+    }
     try:
-        ticker = yf.Ticker(FED_FUNDS_FUTURES_TICKER)
-        
-        # Fetch historical data. yfinance returns a pandas DataFrame.
-        # Let's try to get data for the last ~10 days to ensure we have the last 3 trading days.
-        # Note: For futures, 'period' might be tricky. Using start/end is more reliable.
-        end_date = date.today()
-        start_date = end_date - timedelta(days=10) # Get a small window
-        
-        # interval="1d" for daily data
-        hist_df = ticker.history(start=start_date.strftime('%Y-%m-%d'), 
-                                 end=end_date.strftime('%Y-%m-%d'), 
-                                 interval="1d")
-
-        if hist_df.empty:
+        response = _get_with_retries(YAHOO_CHART_URL.format(ticker=FED_FUNDS_FUTURES_TICKER), params)
+        # orjson parses the raw bytes directly; its JSONDecodeError is a ValueError
+        chart = orjson.loads(response.content)['chart']
+        if chart.get('error') or not chart.get('result'):
+            print(f"Yahoo Finance returned an error for {FED_FUNDS_FUTURES_TICKER}: {chart.get('error')}")
+            return None
+        result = chart['result'][0]
+
+        timestamps = np.array(result.get('timestamp', []), dtype=np.int64)
+        if timestamps.size == 0:
+            print(f"No historical data found for {FED_FUNDS_FUTURES_TICKER} for the given period.")
+            return None
+        # Missing closes come back as null, which numpy turns into NaN
+        closes = np.array(result['indicators']['quote'][0]['close'], dtype=np.float64)
+
+        # Daily bars are stamped with the session open; like yfinance, key each bar
+        # by midnight of its trading date in the exchange timezone
+        session_dates = _trading_date_midnights(timestamps, result.get('meta', {}))
+        # Drop missing closes and the still-open bar for today (end date is exclusive)
+        keep = ~np.isnan(closes) & (session_dates < end_epoch_seconds)
+        timestamps_ms, closes = session_dates[keep] * 1000, closes[keep]
+        if closes.size == 0:
             print(f"No historical data found for {FED_FUNDS_FUTURES_TICKER} for the given period.")
             return None
 
-        print(f"Successfully fetched {len(hist_df)} data points from Yahoo Finance.")
-        # We need the 'Close' price and the 'Date' (timestamp)
-        # The DataFrame index is usually the Datetime object for the date.
-        # Example relevant columns: hist_df.index (for date), hist_df['Close']
-        return hist_df
+        print(f"Successfully fetched {closes.size} data points from Yahoo Finance.")
+        return timestamps_ms, closes
 
-    except Exception as e:
-        # yfinance can raise various exceptions, including for invalid tickers or network issues
+    except httpx.HTTPError as e:
         print(f"Error fetching data from Yahoo Finance for {FED_FUNDS_FUTURES_TICKER}: {e}")
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        print(f"Error parsing Yahoo Finance response for {FED_FUNDS_FUTURES_TICKER}: {e}")
     return None
 
-def calculate_and_store_rates(historical_data_df):
+
+def lambda_handler(event, context):
     """
-    Calculates 1-month OIS rate proxy and Implied FF Rate from Yahoo Finance data (pandas DataFrame)
-    and stores them in DynamoDB. Processes the last 3 available data points from the DataFrame.
+    Entry point for scheduled invocations (AWS Lambda or the container CMD).
+    Module-scope clients and sessions are created once per process and reused while warm.
     """
-    if historical_data_df is None or historical_data_df.empty:
-        print("No historical data DataFrame to process.")
-        return
-
-    # Get the last 3 available data points
-    # The DataFrame is usually sorted chronologically by yfinance
-    points_to_process_df = historical_data_df.tail(3)
-    
-    if points_to_process_df.empty:
-        print("Not enough data points after tail(3) to process.")
-        return
-
-    print(f"Processing the last {len(points_to_process_df)} data points for OIS and Implied FF Rate calculation.")
-
-    items_to_put = []
-    for index_date, row in points_to_process_df.iterrows():
-        try:
-            # The index of the DataFrame row (index_date) is a pandas Timestamp object (datetime-like)
-            # Convert pandas Timestamp to UTC milliseconds epoch
-            # Ensure it's treated as UTC if it's naive, or convert to UTC
-            if index_date.tzinfo is None:
-                dt_object_utc = index_date.tz_localize('UTC') # Assume date is UTC if naive, or adjust based on Yahoo's source timezone
-            else:
-                dt_object_utc = index_date.tz_convert('UTC')
-            
-            timestamp_ms = int(dt_object_utc.timestamp() * 1000)
-            
-            close_price = float(row['Close']) # Get the 'Close' price from the row
-
-            # --- Calculations remain the same ---
-            implied_annual_ff_rate_decimal = (100.0 - close_price) / 100.0
-            implied_ff_rate_to_store_percent = implied_annual_ff_rate_decimal * 100.0
-
-            item_ff = {
-                'metricId': {'S': METRIC_ID_IMPLIED_FF},
-                'timestamp': {'N': str(timestamp_ms)},
-                'value': {'N': f"{implied_ff_rate_to_store_percent:.4f}"}
-            }
-            items_to_put.append({'PutRequest': {'Item': item_ff}})
-
-            daily_rate_decimal = implied_annual_ff_rate_decimal / 360.0
-            n_days = 30.0
-            ois_rate_to_store_percent = None
-            if 1 + daily_rate_decimal > 0:
-                compounded_rate_decimal = ((1 + daily_rate_decimal)**n_days - 1) * (360.0 / n_days)
-                ois_rate_to_store_percent = compounded_rate_decimal * 100.0
-                
-                item_ois = {
-                    'metricId': {'S': METRIC_ID_OIS},
-                    'timestamp': {'N': str(timestamp_ms)},
-                    'value': {'N': f"{ois_rate_to_store_percent:.4f}"}
-                }
-                items_to_put.append({'PutRequest': {'Item': item_ois}})
-            else:
-                print(f"Skipping OIS calculation for date {index_date.strftime('%Y-%m-%d')} due to invalid daily_rate_decimal.")
-
-            print(f"Data for Timestamp: {dt_object_utc.strftime('%Y-%m-%d %H:%M:%S')} UTC, Futures Close: {close_price}")
-            print(f"  Implied FF Rate (ann.): {implied_ff_rate_to_store_percent:.4f}%")
-            if ois_rate_to_store_percent is not None:
-                print(f"  Calculated OIS (1M ann.): {ois_rate_to_store_percent:.4f}%")
-
-        except (KeyError, ValueError, TypeError) as e:
-            print(f"Error processing data row for date {index_date.strftime('%Y-%m-%d') if 'index_date' in locals() else 'unknown'}: {e}")
-            continue
-    # ... (DynamoDB storage part remains the same) ...
-    if items_to_put:
-        try:
-            for req in items_to_put:
-                 dynamodb_client.put_item(
-                    TableName=DYNAMODB_TABLE_NAME,
-                    Item=req['PutRequest']['Item']
-                )
-            print(f"Successfully stored/updated {len(items_to_put)} data points in DynamoDB.")
-        except Exception as e:
-            print(f"Error storing data in DynamoDB: {e}")
-    else:
-        print("No valid data points were prepared for storage.")
-
-
-if __name__ == "__main__":
     print("Starting OIS & Implied FF Rate Fetcher Script (Yahoo Finance)...")
     historical_data = fetch_fed_funds_futures_data()
-    if historical_data is not None:
-        calculate_and_store_rates(historical_data)
+    stored = historical_data is not None and store_rates(*historical_data)
     print("OIS & Implied FF Rate Fetcher Script (Yahoo Finance) finished.")
+    return {'ok': stored}
+
+
+if __name__ == "__main__":
+    lambda_handler(None, None)
@@ -0,0 +1,226 @@
+# ois_core.py - Source-independent OIS / Implied FF rate calculation and DynamoDB storage.
+# Fetchers produce (timestamps_ms, closes) arrays and hand them to store_rates().
+
+import importlib.util
+import numpy as np
+import boto3
+from botocore.config import Config
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+# Configuration
+DYNAMODB_TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME', 'OISRATES')
+AWS_REGION = os.environ.get('AWS_REGION', 'eu-north-1')
+
+# Metric IDs
+METRIC_ID_OIS = os.environ.get('METRIC_ID_OIS', 'CALCULATED_OIS_1M_RATE')
+METRIC_ID_IMPLIED_FF = os.environ.get('METRIC_ID_IMPLIED_FF', 'IMPLIED_FF_RATE')
+# Shared by every item of the same metric; botocore only reads these when serializing
+_METRIC_ID_OIS_ATTR = {'S': METRIC_ID_OIS}
+_METRIC_ID_IMPLIED_FF_ATTR = {'S': METRIC_ID_IMPLIED_FF}
+
+# Compounding term of the 1-month OIS proxy, in days
+OIS_TERM_DAYS = 30
+# Windows shorter than this use plain NumPy: importing numba/numexpr (and loading the JIT
+# cache) costs far more at cold start than they save on a handful of points
+ACCELERATED_RATES_MIN_POINTS = int(os.environ.get('ACCELERATED_RATES_MIN_POINTS', '10000'))
+
+# DynamoDB BatchWriteItem limits
+BATCH_WRITE_MAX_ITEMS = 25
+BATCH_WRITE_MAX_RETRIES = 8
+BATCH_WRITE_WORKERS = int(os.environ.get('BATCH_WRITE_WORKERS', '8'))
+
+# Module-level so warm invocations of a fetcher's handler reuse the client and its TLS connections.
+# The pool is sized above BATCH_WRITE_WORKERS so concurrent batch writes don't queue for a
+# connection; adaptive retries back off client-side when DynamoDB throttles.
+dynamodb_client = boto3.client(
+    'dynamodb',
+    region_name=AWS_REGION,
+    config=Config(max_pool_connections=max(16, BATCH_WRITE_WORKERS),
+                  retries={'max_attempts': 10, 'mode': 'adaptive'}))
+
+def write_batch(put_requests):
+    """
+    Writes up to 25 PutRequests with a single BatchWriteItem call.
+    Items DynamoDB reports back as unprocessed (throttling) are resubmitted with exponential backoff.
+    """
+    request_items = {DYNAMODB_TABLE_NAME: put_requests}
+    for attempt in range(BATCH_WRITE_MAX_RETRIES + 1):
+        response = dynamodb_client.batch_write_item(RequestItems=request_items)
+        request_items = response.get('UnprocessedItems') or {}
+        if not request_items:
+            return
+        if attempt < BATCH_WRITE_MAX_RETRIES:
+            time.sleep(2 ** attempt * 0.05)
+    unprocessed_count = sum(len(reqs) for reqs in request_items.values())
+    raise RuntimeError(f"{unprocessed_count} items still unprocessed after {BATCH_WRITE_MAX_RETRIES} retries")
+
+def _compute_rates_numpy(closes):
+    implied_annual_ff_rate_decimal = (100.0 - closes) / 100.0
+    implied_ff_rate_percent = implied_annual_ff_rate_decimal * 100.0
+    daily_rate_decimal = implied_annual_ff_rate_decimal / 360.0
+    ois_valid = (1.0 + daily_rate_decimal) > 0.0
+    # Invalid points would raise a negative base to a power; mask them out before compounding
+    x = np.where(ois_valid, 1.0 + daily_rate_decimal, 1.0)
+    if OIS_TERM_DAYS == 30:
+        # x**30 as a multiply chain (30 = 16 + 8 + 4 + 2) instead of a libm pow per element
+        x2 = x * x
+        x4 = x2 * x2
+        x8 = x4 * x4
+        x16 = x8 * x8
+        compounded = x16 * x8 * x4 * x2
+    else:
+        compounded = np.power(x, OIS_TERM_DAYS)
+    ois_rate_percent = np.where(
+        ois_valid, (compounded - 1.0) * (360.0 / OIS_TERM_DAYS) * 100.0, np.nan)
+    return implied_ff_rate_percent, ois_rate_percent, ois_valid
+
+def _compute_rates_loop(closes):
+    n = closes.shape[0]
+    implied_ff_rate_percent = np.empty(n)
+    ois_rate_percent = np.empty(n)
+    ois_valid = np.empty(n, dtype=np.bool_)
+    for i in range(n):
+        implied_annual_ff_rate_decimal = (100.0 - closes[i]) / 100.0
+        implied_ff_rate_percent[i] = implied_annual_ff_rate_decimal * 100.0
+        daily_rate_decimal = implied_annual_ff_rate_decimal / 360.0
+        x = 1.0 + daily_rate_decimal
+        if x > 0.0:
+            # OIS_TERM_DAYS is a compile-time constant for numba, so this branch folds away
+            if OIS_TERM_DAYS == 30:
+                x2 = x * x
+                x4 = x2 * x2
+                x8 = x4 * x4
+                x16 = x8 * x8
+                compounded = x16 * x8 * x4 * x2
+            else:
+                compounded = x ** OIS_TERM_DAYS
+            ois_rate_percent[i] = (compounded - 1.0) * (360.0 / OIS_TERM_DAYS) * 100.0
+            ois_valid[i] = True
+        else:
+            ois_rate_percent[i] = np.nan
+            ois_valid[i] = False
+    return implied_ff_rate_percent, ois_rate_percent, ois_valid
+
+def _compute_rates_numexpr(closes):
+    import numexpr as ne
+    daily_rate = "((100.0 - closes) / 100.0 / 360.0)"
+    implied_ff_rate_percent = ne.evaluate("(100.0 - closes) / 100.0 * 100.0")
+    ois_valid = ne.evaluate(f"(1.0 + {daily_rate}) > 0.0")
+    # numexpr expands the integer power into multiplications and evaluates both where()
+    # branches, which is harmless here since an even power of a negative base is finite
+    ois_rate_percent = ne.evaluate(
+        f"where(ois_valid, ((1.0 + {daily_rate}) ** {OIS_TERM_DAYS} - 1.0) * {360.0 / OIS_TERM_DAYS} * 100.0, nan)",
+        local_dict={'closes': closes, 'ois_valid': ois_valid, 'nan': np.nan})
+    return implied_ff_rate_percent, ois_rate_percent, ois_valid
+
+# Resolved on first use; see _get_accelerated_rates_kernel
+_accelerated_rates_kernel = None
+
+def _get_accelerated_rates_kernel():
+    """
+    Picks the kernel for large (backfill) windows, importing the optional packages only here.
+    With numba the explicit loop compiles to a tight native kernel (cached on disk after the
+    first run); otherwise numexpr evaluates each expression in one pass without temporaries,
+    and plain NumPy is the fallback.
+    """
+    global _accelerated_rates_kernel
+    if _accelerated_rates_kernel is None:
+        try:
+            from numba import njit
+            _accelerated_rates_kernel = njit(cache=True)(_compute_rates_loop)
+        except ImportError:
+            if importlib.util.find_spec('numexpr') is not None:
+                _accelerated_rates_kernel = _compute_rates_numexpr
+            else:
+                _accelerated_rates_kernel = _compute_rates_numpy
+    return _accelerated_rates_kernel
+
+def compute_rates(closes):
+    """
+    Calculates, from a float64 array of Fed Funds futures closes, the implied annual FF rate (%),
+    the 30-day compounded OIS proxy (%, NaN where invalid) and the OIS validity mask.
+
+    store_rates only ever passes its last 3 points, so the scheduled script always takes the
+    NumPy path. The numba/numexpr kernels are reached only by outside callers (e.g. an ad-hoc
+    historical backfill) passing ACCELERATED_RATES_MIN_POINTS or more closes; nothing in this
+    repo calls compute_rates that way.
+    """
+    closes = np.ascontiguousarray(closes, dtype=np.float64)
+    if closes.shape[0] < ACCELERATED_RATES_MIN_POINTS:
+        return _compute_rates_numpy(closes)
+    return _get_accelerated_rates_kernel()(closes)
+
+def store_rates(timestamps_ms, closes):
+    """
+    Calculates 1-month OIS rate proxy and Implied FF Rate from Fed Funds futures daily closes
+    (parallel numpy arrays of epoch-millisecond timestamps and close prices, in chronological
+    order) and stores them in DynamoDB. Processes the last 3 available data points.
+    Returns True only if every prepared item was written.
+    """
+    if closes is None or len(closes) == 0:
+        print("No historical data to process.")
+        return False
+
+    # Get the last 3 available data points
+    timestamps_ms = np.asarray(timestamps_ms, dtype=np.int64)[-3:]
+    closes = np.asarray(closes, dtype=np.float64)[-3:]
+
+    print(f"Processing the last {len(closes)} data points for OIS and Implied FF Rate calculation.")
+
+    implied_ff_rate_to_store_percent, ois_rate_to_store_percent, ois_valid = compute_rates(closes)
+
+    # Format the DynamoDB number strings for all points in one pass each.
+    # tolist() hands plain Python str/int/float/bool to the loops and to botocore.
+    timestamp_strs = timestamps_ms.astype(str).tolist()
+    ff_value_strs = np.char.mod('%.4f', implied_ff_rate_to_store_percent).tolist()
+    ois_value_strs = np.char.mod('%.4f', ois_rate_to_store_percent).tolist()
+    dts_utc = [datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc) for timestamp_ms in timestamps_ms.tolist()]
+    # Split on the validity mask once instead of branching per point
+    ois_valid_idx = np.flatnonzero(ois_valid).tolist()
+    ois_invalid_idx = np.flatnonzero(~ois_valid).tolist()
+
+    items_to_put = [
+        {'PutRequest': {'Item': {
+            'metricId': _METRIC_ID_IMPLIED_FF_ATTR,
+            'timestamp': {'N': timestamp_str},
+            'value': {'N': ff_value_str}
+        }}}
+        for timestamp_str, ff_value_str in zip(timestamp_strs, ff_value_strs)
+    ]
+    items_to_put.extend(
+        {'PutRequest': {'Item': {
+            'metricId': _METRIC_ID_OIS_ATTR,
+            'timestamp': {'N': timestamp_strs[i]},
+            'value': {'N': ois_value_strs[i]}
+        }}}
+        for i in ois_valid_idx
+    )
+    if ois_invalid_idx:
+        skipped_dates = ', '.join(dts_utc[i].strftime('%Y-%m-%d') for i in ois_invalid_idx)
+        print(f"Skipping OIS calculation for dates {skipped_dates} due to invalid daily_rate_decimal.")
+
+    for dt_object_utc, close_price, ff_value_str, ois_value_str, is_ois_valid in zip(
+            dts_utc, closes.tolist(), ff_value_strs, ois_value_strs, ois_valid.tolist()):
+        print(f"Data for Timestamp: {dt_object_utc.strftime('%Y-%m-%d %H:%M:%S')} UTC, Futures Close: {close_price}")
+        print(f"  Implied FF Rate (ann.): {ff_value_str}%")
+        if is_ois_valid:
+            print(f"  Calculated OIS (1M ann.): {ois_value_str}%")
+
+    if items_to_put:
+        try:
+            # BatchWriteItem accepts at most 25 put requests per call; the batches are
+            # independent, so send them concurrently (boto3 clients are thread-safe)
+            batches = [items_to_put[i:i + BATCH_WRITE_MAX_ITEMS]
+                       for i in range(0, len(items_to_put), BATCH_WRITE_MAX_ITEMS)]
+            with ThreadPoolExecutor(max_workers=min(BATCH_WRITE_WORKERS, len(batches))) as executor:
+                list(executor.map(write_batch, batches))
+            print(f"Successfully stored/updated {len(items_to_put)} data points in DynamoDB.")
+            return True
+        except Exception as e:
+            print(f"Error storing data in DynamoDB: {e}")
+    else:
+        print("No valid data points were prepared for storage.")
+    return False